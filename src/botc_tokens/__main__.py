@@ -1,11 +1,11 @@
 """Main Script for m4b-util."""
 import argparse
+import importlib
 import sys
 
 from rich import print
 
 from .__version__ import version
-from .commands import create, dump_components, group, update
 
 
 def _print_version():
@@ -14,27 +14,35 @@ def _print_version():
     return 0
 
 
-# Set up the dictionary of commands. The values are tuples, first the function to run, second the description.
+# Set up the dictionary of commands. The values are tuples, first the module and function to run, then the description.
+# Subcommand modules are only imported once chosen, so cheap commands don't pay for loading Wand and friends.
 allowed_commands = {
-    "create": (create.run, "Create token images to match json files in a directory tree."),
-    "dump-components": (dump_components.run, "Write all the default components to the specified directory."),
-    "group": (group.run, "Create printable sheets of roles and reminder from a json script file."),
-    "update": (update.run, "Download roles from the wiki, with associated icon and description."),
-    "version": (_print_version, "Print version and exit."),
+    "create": ("create", "run", "Create token images to match json files in a directory tree."),
+    "dump-components": ("dump_components", "run", "Write all the default components to the specified directory."),
+    "group": ("group", "run", "Create printable sheets of roles and reminder from a json script file."),
+    "update": ("update", "run", "Download roles from the wiki, with associated icon and description."),
+    "version": (None, "_print_version", "Print version and exit."),
 }
 
 
+def _get_command(module_name, func_name):
+    """Import the module for a subcommand, if needed, and return the function to run."""
+    if module_name is None:
+        return globals()[func_name]
+    module = importlib.import_module(f".commands.{module_name}", __package__)
+    return getattr(module, func_name)
+
+
 def main():
     """Run the application."""
     # Write our usage message
+    command_list = "".join(f"{name:18}: {description}\n" for name, (*_, description) in allowed_commands.items())
     usage = ("botc_tokens <command> [<args>]\n\n"
              "Allowed Commands:\n"
+             f"{command_list}"
+             "\nFor more help with a command, use botc_tokens <command> --help\n"
+             " \n"
              )
-    for name, (_, description) in allowed_commands.items():
-        usage += f"{name:18}: {description}\n"
-    usage += ("\nFor more help with a command, use botc_tokens <command> --help\n"
-              " \n"
-              )
 
     # Set up argparse
     parser = argparse.ArgumentParser(
@@ -55,7 +63,8 @@ def main():
         exit(-1)
 
     # Invoke the subcommand
-    retcode = allowed_commands[args.command][0]()
+    module_name, func_name, _ = allowed_commands[args.command]
+    retcode = _get_command(module_name, func_name)()
 
     print("[bold green]Done![/]")
     exit(retcode)
@@ -1,24 +1,32 @@
 """Command to create token images to match json files in a directory tree."""
 # Standard Library
 import argparse
-import json
+from concurrent.futures import as_completed, ProcessPoolExecutor
+from dataclasses import fields, replace
+import glob
+import hashlib
+import multiprocessing
+import os
 from pathlib import Path
 import sys
 from zipfile import BadZipFile
 
 # Third Party
+import orjson
 from rich import print
 from rich.live import Live
 from wand.exceptions import BlobError
 from wand.image import Image
+from wand.resource import limits
 
 # Application Specific
 from .. import component_path as default_component_path
+from ..helpers.arguments import positive_int
 from ..helpers.progress_group import setup_progress_group
 from ..helpers.role import Role
-from ..helpers.text_tools import format_filename
+from ..helpers.text_tools import format_filename, set_disk_cache
 from ..helpers.token_components import TokenComponents
-from ..helpers.token_creation import create_reminder_token, create_role_token
+from ..helpers.token_creation import create_reminder_base, create_reminder_token, create_role_token
 
 
 def _parse_args():
@@ -40,19 +48,57 @@ def _parse_args():
     parser.add_argument('--reminder-diameter', type=int, default=reminder_diameter_default,
                         help="The diameter (in pixels) to use for reminder tokens. Components will be resized to fit. "
                              f"(Default: {reminder_diameter_default})")
+    png_compression_default = 1
+    parser.add_argument('--png-compression', type=int, default=png_compression_default, choices=range(10),
+                        metavar="{0-9}",
+                        help="The zlib compression level to use when saving tokens. Higher levels make slightly "
+                             f"smaller files, but take much longer to save. (Default: {png_compression_default})")
+    parser.add_argument('--rebuild-changed', action='store_true',
+                        help="Keep a manifest of what each token was made from in the output directory, and recreate "
+                             "any tokens whose JSON or icon has changed since the last run. The first run with this "
+                             "option recreates every token, since there is no manifest to compare against yet.")
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help="A directory in which to keep rendered text between runs, so names and abilities that "
+                             "haven't changed don't need to be rendered again. (Default: No cache)")
+    parser.add_argument('-j', '--jobs', type=positive_int, default=os.cpu_count(),
+                        help="The number of roles to create tokens for in parallel. (Default: The number of CPUs)")
     args = parser.parse_args(sys.argv[2:])
     return args
 
 
+# Name of the file in the output directory that records what each token was made from
+manifest_name = ".manifest.json"
+
+# Wand images can't be shared between processes, so each worker process loads its own copy of the components.
+_worker_components = None
+# Output directories this process has already made, so roles of the same type don't each ask for it again.
+_created_dirs = set()
+
+
+def _init_worker(component_package, role_diameter, reminder_diameter, cache_dir=None):
+    """Load the token components once per worker process."""
+    global _worker_components
+    # The pool already keeps every core busy, so stop ImageMagick from spawning threads of its own on top of it.
+    limits["thread"] = 1
+    set_disk_cache(cache_dir)
+    _worker_components = TokenComponents(component_package)
+    _worker_components.scale(role_diameter, reminder_diameter)
+
+
+def _create_tokens_in_worker(role, output_dir, role_diameter, reminder_diameter, png_compression=None):
+    """Create the tokens for a role using the components loaded by this worker process."""
+    create_tokens_for_role(role, _worker_components, output_dir, role_diameter, reminder_diameter, png_compression)
+
+
 def run():
     """Use JSON to create a set of tokens."""
     args = _parse_args()
-    json_files = [file for file in Path(args.search_dir).rglob("*.json")]
+    json_files = list(find_json_files(args.search_dir))
     if len(json_files) == 0:
         print("[red]Error: [/][bold]No JSON files found in the search directory.[/]")
         return
     print("[green]Finding Roles...[/]")
-    roles = find_roles_from_json(json_files)
+    roles = _unique_roles(find_roles_from_json(json_files))
     print(f"[green]Creating tokens in {args.output_dir}...[/]", end="")
     output_dir = Path(args.output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -62,64 +108,211 @@ def run():
     if components is None:
         return
 
+    # Clear out the tokens for any roles that changed since they were made, so they are created again
+    manifest = None
+    if args.rebuild_changed:
+        manifest = remove_changed_tokens(roles, output_dir)
+
     # Create the tokens
     progress_group, overall_progress, step_progress = setup_progress_group()
 
     with Live(progress_group):
-        output_path = Path(args.output_dir)
         overall_task = overall_progress.add_task("Creating Tokens...", total=len(roles))
         step_task = step_progress.add_task("Reading roles...")
-        for role in roles:
-            step_progress.update(step_task, description=f"Creating Token for: {role.name}")
-            # Make sure our target directory exists
-            role_output_path = output_path / role.type
-            role_output_path.mkdir(parents=True, exist_ok=True)
-
-            # Skip if the token already exists
-            token_output_path = role_output_path / f"{format_filename(role.name)}.png"
-            if token_output_path.exists():
-                continue
-
-            # Create the reminder tokens
-            icon = Image(filename=role.icon)
-            reminder_icon = icon.clone()
-            # The "^" modifier means this transform specifies the minimum height and width.
-            # A transform without a modifier specifies the maximum height and width.
-            target_width = components.reminder_bg.width * 0.75
-            target_height = components.reminder_bg.height * 0.75
-            reminder_icon.transform(resize=f"{target_width}x{target_height}^")
-            reminder_icon.transform(resize=f"{target_width}x{target_height}")
-            for reminder_text in role.reminders:
-                step_progress.update(step_task, description=f"Creating Token for: {role.name}")
-                reminder_name = format_filename(f"{role.name}-Reminder-{reminder_text}")
-                reminder_output_path = role_output_path / f"{reminder_name}.png"
-                duplicate_counter = 1
-                while reminder_output_path.exists():
-                    duplicate_counter += 1
-                    reminder_output_path = role_output_path / f"{reminder_name}-{duplicate_counter}.png"
-
-                reminder_token = create_reminder_token(reminder_icon, reminder_text, components, args.reminder_diameter)
-                # Save the reminder token
-                reminder_token.save(filename=reminder_output_path)
-                reminder_token.close()
-            reminder_icon.close()
-
-            # Composite the various pieces of the token.
-            step_progress.update(step_task, description=f"Creating Token for: {role.name}")
-            token_icon = icon.clone()
-
-            token = create_role_token(token_icon, role, components, args.role_diameter)
-            # Save the token
-            token.save(filename=token_output_path)
-            token.close()
-
-            # Update the progress bar
+        for role in _create_all_tokens(roles, components, args):
+            step_progress.update(step_task, description=f"Created Token for: {role.name}")
             overall_progress.update(overall_task, advance=1)
 
+    if manifest is not None:
+        (output_dir / manifest_name).write_bytes(orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
+
     # Close the component images
     components.close()
 
 
+def _create_all_tokens(roles, components, args):
+    """Create the tokens for every role, yielding each role as it is finished.
+
+    Roles are independent of each other, so unless only a single job was requested (or there is only one role) they
+    are spread across a pool of worker processes.
+
+    Args:
+        roles (list[Role]): The roles to create tokens for.
+        components (TokenComponents): The component package to use when running in this process.
+        args (argparse.Namespace): The parsed command line arguments.
+    """
+    output_dir = Path(args.output_dir)
+    # Each worker has to load its own components, so don't start more of them than there are roles to hand out.
+    jobs = min(args.jobs or 1, len(roles))
+    if jobs <= 1:
+        set_disk_cache(args.cache_dir)
+        components.scale(args.role_diameter, args.reminder_diameter)
+        for role in roles:
+            create_tokens_for_role(role, components, output_dir, args.role_diameter, args.reminder_diameter,
+                                   args.png_compression)
+            yield role
+        return
+
+    # Use spawn rather than fork, since forking a process that already has ImageMagick (and rich's refresh thread)
+    # running is not safe. Workers load from the directory our components came from, so a zipped package only has to
+    # be extracted once.
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(components.comp_path, args.role_diameter, args.reminder_diameter,
+                                       args.cache_dir)) as executor:
+        futures = {}
+        for role in roles:
+            future = executor.submit(_create_tokens_in_worker, role, output_dir, args.role_diameter,
+                                     args.reminder_diameter, args.png_compression)
+            futures[future] = role
+        try:
+            for future in as_completed(futures):
+                future.result()  # Re-raise anything that went wrong in the worker
+                yield futures[future]
+        except BaseException:
+            # Don't make the error wait on every role that hasn't started yet
+            for pending in futures:
+                pending.cancel()
+            raise
+
+
+def _unique_roles(roles):
+    """Drop any role that shares its token files with an earlier role, keeping the first one found.
+
+    Roles with the same name and type (such as a role found under two script versions) write to the same token. One at
+    a time, the later role would find the earlier token and be skipped, but in parallel both could be made at once, so
+    the later roles are dropped up front instead.
+
+    Args:
+        roles (list[Role]): The roles, in the order they were found.
+    """
+    seen = set()
+    unique_roles = []
+    for role in roles:
+        key = (role.type, format_filename(role.name))
+        if key not in seen:
+            seen.add(key)
+            unique_roles.append(role)
+    return unique_roles
+
+
+def create_tokens_for_role(role, components, output_dir, role_diameter, reminder_diameter, png_compression=None):
+    """Create the role token and all the reminder tokens for a single role.
+
+    Args:
+        role (Role): The role to create tokens for.
+        components (TokenComponents): The component package to use.
+        output_dir (Path): The directory in which to write the tokens.
+        role_diameter (int): The diameter (in pixels) to use for the role token.
+        reminder_diameter (int): The diameter (in pixels) to use for the reminder tokens.
+        png_compression (int|None): The zlib compression level (0-9) to save the tokens with. If None, ImageMagick's
+            default is used.
+    """
+    # Make sure our target directory exists
+    role_output_path = output_dir / role.type
+    if role_output_path not in _created_dirs:
+        role_output_path.mkdir(parents=True, exist_ok=True)
+        _created_dirs.add(role_output_path)
+
+    # Skip if the token already exists
+    token_output_path = role_output_path / f"{format_filename(role.name)}.png"
+    if token_output_path.exists():
+        return
+
+    # Size the reminder icon first, so the full size icon can be handed over to the role token and freed right away,
+    # rather than staying decoded while all the reminders are made.
+    icon = Image(filename=role.icon)
+    reminder_icon = icon.clone()
+    # A resize without a modifier scales the icon, up or down, to the largest size that fits in the target box while
+    # keeping its aspect ratio.
+    target_width = components.reminder_bg.width * 0.75
+    target_height = components.reminder_bg.height * 0.75
+    reminder_icon.transform(resize=f"{target_width}x{target_height}")
+
+    # Composite the various pieces of the token. Nothing else needs the original icon at this point, so hand it over
+    # rather than cloning it again. (create_role_token closes it for us.)
+    token = create_role_token(icon, role, components, role_diameter)
+
+    # Create the reminder tokens
+    # Remember the last number used for each reminder name, so repeated reminders don't have to re-check every
+    # filename we have already written.
+    last_duplicate = {}
+    # Only the text differs between a role's reminders, so place the icon on the background just once.
+    reminder_base = create_reminder_base(reminder_icon, components)
+    for reminder_text in role.reminders:
+        reminder_name = format_filename(f"{role.name}-Reminder-{reminder_text}")
+        duplicate_counter = last_duplicate.get(reminder_name, 0) + 1
+        reminder_output_path = _reminder_output_path(role_output_path, reminder_name, duplicate_counter)
+        while reminder_output_path.exists():
+            duplicate_counter += 1
+            reminder_output_path = _reminder_output_path(role_output_path, reminder_name, duplicate_counter)
+        last_duplicate[reminder_name] = duplicate_counter
+
+        reminder_token = create_reminder_token(reminder_icon, reminder_text, components, reminder_diameter,
+                                               reminder_base)
+        # Save the reminder token
+        _save_png(reminder_token, reminder_output_path, png_compression)
+        reminder_token.close()
+    reminder_base.close()
+    reminder_icon.close()
+
+    # Save the token last, since its existence is what marks the role as done.
+    _save_png(token, token_output_path, png_compression)
+    token.close()
+
+
+def remove_changed_tokens(roles, output_dir):
+    """Delete the existing tokens for any role that has changed since they were created.
+
+    Each role is hashed from its data and its icon file, and compared with the manifest left in the output directory by
+    the previous run. The icon's path depends on how the search directory was spelled on the command line, so only its
+    contents are hashed. Tokens only exist for roles that were finished, so the manifest can simply record every role.
+
+    Args:
+        roles (list[Role]): The roles tokens are about to be created for.
+        output_dir (Path): The directory in which the tokens are written.
+
+    Returns:
+        dict: The updated manifest, mapping each role token's path (relative to output_dir) to its hash.
+    """
+    try:
+        manifest = orjson.loads((output_dir / manifest_name).read_bytes())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        manifest = {}
+
+    for role in roles:
+        token_name = format_filename(role.name)
+        token_key = f"{role.type}/{token_name}.png"
+        role_hash = hashlib.blake2b(orjson.dumps(replace(role, icon=None)))
+        try:
+            with open(role.icon, "rb") as f:
+                role_hash.update(f.read())
+        except OSError:
+            pass  # A missing icon will be reported when the token is created
+        role_hash = role_hash.hexdigest()
+        if manifest.get(token_key) != role_hash:
+            role_output_path = output_dir / role.type
+            (role_output_path / f"{token_name}.png").unlink(missing_ok=True)
+            for reminder_file in role_output_path.glob(f"{glob.escape(token_name)}-Reminder-*.png"):
+                reminder_file.unlink()
+            manifest[token_key] = role_hash
+    return manifest
+
+
+def _reminder_output_path(role_output_path, reminder_name, duplicate_counter):
+    """Return the path for a reminder token, numbering any after the first with the same name."""
+    if duplicate_counter == 1:
+        return role_output_path / f"{reminder_name}.png"
+    return role_output_path / f"{reminder_name}-{duplicate_counter}.png"
+
+
+def _save_png(image, output_path, compression):
+    """Save an image as a PNG, at the given zlib compression level if one is set."""
+    if compression is not None:
+        image.options["png:compression-level"] = str(compression)
+    image.save(filename=output_path)
+
+
 def load_components(component_package):
     """Handle loading the components from a directory or zip file, and alerting the user if it fails."""
     try:
@@ -137,26 +330,48 @@ def load_components(component_package):
     return components
 
 
+def find_json_files(search_dir):
+    """Recursively yield the path of every json file in a directory tree.
+
+    This walks the tree with os.scandir, so the file type information that comes back with each directory listing is
+    reused instead of stat-ing every entry again the way Path.rglob does. Directories still to be searched are kept on
+    a stack rather than recursing, and paths are yielded as plain strings, straight from the directory entries.
+
+    Args:
+        search_dir (str|Path): The top level directory in which to begin the search.
+    """
+    pending_dirs = [search_dir]
+    while pending_dirs:
+        try:
+            entries = os.scandir(pending_dirs.pop())
+        except OSError:
+            continue  # Missing or unreadable directories simply have no json files in them
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending_dirs.append(entry.path)
+                elif entry.name.endswith(".json"):
+                    yield entry.path
+
+
 def find_roles_from_json(json_files):
     """Load each json file and return the roles."""
     roles = []
+    role_fields = [field.name for field in fields(Role)]
     for json_file in json_files:
         try:
-            with open(json_file, "r") as f:
-                data = json.load(f)
+            with open(json_file, "rb") as f:
+                data = orjson.loads(f.read())
             # Rewrite the icon path to be relative to our working directory
-            data['icon'] = str(json_file.parent / data.get('icon'))
+            data['icon'] = os.path.join(os.path.dirname(json_file), data.get('icon'))
             role = Role(data.get('name', "Unknown"))
-            for att in dir(role):
+            for att in role_fields:
                 if att in data:
                     setattr(role, att, data[att])
             roles.append(role)
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             print(f"[red]Error:[/][bold] Could not decode JSON file:[/] {json_file}")
             print(f"- {str(e)}")
-        except UnicodeDecodeError as e:
-            print(f"[red]Error:[/][bold] Could not decode JSON file: {json_file}")
-            print(f"- {str(e)}")
         except Exception as e:
             print(f"[red]Error:[/][bold] Unknown error loading JSON file: {json_file}")
             print(f"- {str(e)}")
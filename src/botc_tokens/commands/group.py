@@ -3,16 +3,16 @@
 import argparse
 import json
 from pathlib import Path
-import re
 import sys
 
 # Third Party
-from jsonschema import validate, ValidationError
+from jsonschema import ValidationError
 from rich import print
 from rich.live import Live
 
 # Application Specific
 from .. import data_dir
+from ..helpers.json_schema import validate
 from ..helpers.printable import Printable
 from ..helpers.progress_group import setup_progress_group
 
@@ -127,15 +127,25 @@ def process_tokens(duplicates, duplicates_overrides, reminder_images, reminder_p
 
     If we are being honest, this function exists separate from the run() function only to decrease its complexity.
     """
+    # Index the role images by name, so finding each role's token is a lookup rather than a scan of every image.
+    # If more than one image has the same name, the first one wins.
+    role_index = {}
+    for role_image in role_images:
+        role_index.setdefault(_token_key(role_image), role_image)
+    # Likewise group the reminder images by the role name in front of "-reminder".
+    reminder_index = {}
+    for reminder_image in reminder_images:
+        reminder_role = _token_key(reminder_image).split("-reminder", 1)[0]
+        reminder_index.setdefault(reminder_role, []).append(reminder_image)
+
     for role in script:
         if isinstance(role, dict):
             continue  # Skip metadata
-        role_name = role.lower().strip()
+        role_name = role.casefold().strip()
         step_progress.update(step_task, description=f"Adding {role_name.title()}")
         # See if we have tokens for this role
-        role_file = next((t for t in role_images if role_name == t.stem.lower().replace("'", "")), None)
-        reminder_regex = re.compile(f"{role_name}-reminder.*")
-        reminder_files = (t for t in reminder_images if reminder_regex.match(t.stem.lower().replace("'", "")))
+        role_file = role_index.get(role_name)
+        reminder_files = reminder_index.get(role_name, [])
         if not role_file:
             print(f"[yellow]Warning:[/] No token found for {role_name}")
             continue
@@ -152,6 +162,11 @@ def process_tokens(duplicates, duplicates_overrides, reminder_images, reminder_p
             reminder_page.add_token(reminder)
 
 
+def _token_key(token_file):
+    """Normalise a token's filename to match it against the role names in a script."""
+    return token_file.stem.casefold().replace("'", "")
+
+
 def load_duplicates(user_duplicates):
     """Load the known duplicates and user overrides."""
     duplicates_overrides = {}
@@ -160,7 +175,7 @@ def load_duplicates(user_duplicates):
     if user_duplicates:
         with open(user_duplicates, "r") as f:
             json_data = json.load(f)
-            validate(json_data, json.load(open(data_dir / "duplicate_schema.json")))
+            validate(json_data, "duplicate_schema.json")
             duplicates_overrides = json_data
     return duplicates, duplicates_overrides
 
@@ -3,8 +3,8 @@
 """Download story from the requested url."""
 # Standard library
 import argparse
-from dataclasses import asdict
-import json
+from concurrent.futures import as_completed, ThreadPoolExecutor
+from email.utils import formatdate
 from pathlib import Path
 import sys
 from time import sleep
@@ -13,7 +13,8 @@ import urllib.parse
 from urllib.request import Request, urlopen
 
 # Third-party libraries
-from jsonschema import validate, ValidationError
+from jsonschema import ValidationError
+import orjson
 from rich import print
 from rich.live import Live
 from wand.color import Color
@@ -21,12 +22,18 @@ from wand.image import Image
 
 # Application specific
 from .. import data_dir
+from ..helpers.arguments import positive_int
+from ..helpers.json_schema import validate
 from ..helpers.progress_group import setup_progress_group
 from ..helpers.role import Role
 from ..helpers.text_tools import format_filename
 from ..helpers.wiki_soup import WikiSoup
 
 
+# Headers sent with every icon download
+request_headers = {'User-Agent': 'Mozilla/5.0'}
+
+
 def _parse_args():
     parser = argparse.ArgumentParser(description='Download roles from the wiki, with associated icon and description.')
     parser.add_argument('-o', '--output-dir', type=str, default='inputs',
@@ -37,6 +44,14 @@ def _parse_args():
                         help="JSON file to override reminder guesses from the wiki.")
     parser.add_argument('-c', '--custom-list', type=str, default=None,
                         help="JSON file with a custom list of roles to update.")
+    parser.add_argument('--refresh-icons', action='store_true',
+                        help="Check existing icons against the web, and download any that have changed since.")
+    parser.add_argument('--wiki-cache', type=str, default=None,
+                        help="Directory in which to keep downloaded wiki pages. Later runs only download a page again "
+                             "if the wiki has changed it since. (Default: None, which downloads every page each run)")
+    jobs_default = 16
+    parser.add_argument('-j', '--jobs', type=positive_int, default=jobs_default,
+                        help=f"The number of roles to download at once. (Default: {jobs_default})")
     args = parser.parse_args(sys.argv[2:])
     return args
 
@@ -52,79 +67,117 @@ def run():
         role_task = overall_progress.add_task("Updating role data...", total=None)
 
         step_task = step_progress.add_task("Grabbing role data")
-        wiki = prep_wiki(args.script_filter, args.custom_list)
+        wiki = prep_wiki(args.script_filter, args.custom_list, args.wiki_cache)
         if wiki is None:
             return 1
 
         # Open the reminder overrides file, if it exists
         step_progress.update(step_task, description="Reading reminder overrides file")
         if args.reminders:
-            with open(args.reminders, "r") as f:
-                json_data = json.load(f)
+            with open(args.reminders, "rb") as f:
+                json_data = orjson.loads(f.read())
                 try:
-                    validate(json_data, json.load(open(data_dir / "reminder_schema.json")))
+                    validate(json_data, "reminder_schema.json")
                 except ValidationError as e:
                     print(f"[red]Error:[/] {args.reminders} does not match the schema: {e}")
                     return 1
                 wiki.reminder_overrides = json_data
 
-        # Read in the forced_setup list
-        with open(data_dir / "forced_setup.json", "r") as f:
-            forced_setup = json.load(f)
+        # Read in the forced_setup list, as a set so checking each role is a quick lookup
+        with open(data_dir / "forced_setup.json", "rb") as f:
+            forced_setup = frozenset(name.lower() for name in orjson.loads(f.read()))
+
+        # Create each output directory once up front, rather than once per role
+        role_dirs = {_role_output_path(role, output_path) for role in wiki.role_data if role.get("id") != "_meta"}
+        for role_dir in role_dirs:
+            role_dir.mkdir(parents=True, exist_ok=True)
 
-        # Step through each role and grab the relevant data before adding it to the list.
+        # Step through each role and grab the relevant data before writing it out. Nearly all the time is spent
+        # waiting on the web, so the roles are handled on a pool of threads.
         overall_progress.update(role_task, total=len(wiki.role_data))
-        for role in wiki.role_data:
-            if role.get("id") == "_meta":  # Skip the metadata
-                overall_progress.update(role_task, advance=1)
-                continue
-            step_progress.update(step_task, description=f"Found role: {role['name']}")
-            # Determine this role's team, preferring the roleType field
-            team = role.get("roleType")
-            team = role.get("team") if team is None else team
-            team = "Unknown" if team is None else team
-
-            version = role.get("version", "Unknown")
-
-            role_output_path = output_path / version / team
-            role_output_path.mkdir(parents=True, exist_ok=True)
-            role_file = role_output_path / f"{format_filename(role['name'])}.json"
-
-            found_role = process_role(role, role_file, wiki, step_progress, step_task, role_output_path)
-
-            if found_role is not None:
-                # Check if the role is in our forced_setup list
-                if found_role.name.lower() in forced_setup:
-                    found_role.affects_setup = True
-
-                # Write it out
-                step_progress.update(step_task, description=f"Writing role file for {found_role.name}")
-                with open(role_file, "w") as f:
-                    f.write(json.dumps(asdict(found_role)))
-
-            # Update progress bar
-            overall_progress.update(role_task, advance=1)
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [
+                executor.submit(update_role, role, output_path, wiki, forced_setup, args.refresh_icons)
+                for role in wiki.role_data
+            ]
+            try:
+                for future in as_completed(futures):
+                    name = future.result()  # Re-raise anything that went wrong in the thread
+                    if name:
+                        step_progress.update(step_task, description=f"Updated role: {name}")
+                    overall_progress.update(role_task, advance=1)
+            except BaseException:
+                # Don't make the error wait on every role that hasn't started yet
+                for pending in futures:
+                    pending.cancel()
+                raise
         step_progress.stop_task(step_task)
 
 
-def prep_wiki(script_filter, custom_list=None):
+def update_role(role, output_path, wiki, forced_setup, refresh_icons=False):
+    """Gather the data and icon for a single role, and write out its json file.
+
+    This runs on a worker thread, so progress is left to the caller.
+
+    Args:
+        role (dict): The role data from the script tool or custom list.
+        output_path (Path): The top level directory in which to write the roles.
+        wiki (WikiSoup): The wiki soup object.
+        forced_setup (frozenset[str]): Lowercase names of the roles that always affect setup.
+        refresh_icons (bool): Check icons that were already downloaded for changes.
+
+    Returns:
+        str: The name of the role, or None if the entry was skipped.
+    """
+    if role.get("id") == "_meta":  # Skip the metadata
+        return None
+    role_output_path = _role_output_path(role, output_path)
+    role_file = role_output_path / f"{format_filename(role['name'])}.json"
+
+    found_role = process_role(role, role_file, wiki, role_output_path, refresh_icons)
+
+    if found_role is not None:
+        # Check if the role is in our forced_setup list
+        if found_role.name.lower() in forced_setup:
+            found_role.affects_setup = True
+
+        # Write it out
+        role_file.write_bytes(orjson.dumps(found_role))
+    return role['name']
+
+
+def _role_output_path(role, output_path):
+    """Return the directory a role's files are written to, based on its script version and team."""
+    # Determine this role's team, preferring the roleType field
+    team = _coalesce(role, "roleType", "team")
+    version = _coalesce(role, "version")
+    return output_path / version / team
+
+
+def _coalesce(role, *keys, default="Unknown"):
+    """Return the value of the first of the keys that is set in the role data, or the default if none are."""
+    return next((role[key] for key in keys if role.get(key) is not None), default)
+
+
+def prep_wiki(script_filter, custom_list=None, wiki_cache=None):
     """Prepare the wiki object, loading the data from the web or a custom list.
 
     Args:
         script_filter (str): The filter to use when downloading the data.
         custom_list (str): The path to a custom list of roles to use.
+        wiki_cache (str): A directory in which to keep wiki pages between runs.
     """
     # Gather the requested role data
-    wiki = WikiSoup(script_filter)
+    wiki = WikiSoup(script_filter, wiki_cache)
     if custom_list:
         custom_list_path = Path(custom_list)
         if not custom_list_path.exists():
             print(f"[red]Error:[/] Could not find '{custom_list}'")
             return None
-        with open(custom_list_path, "r") as f:
-            custom_list = json.load(f)
+        with open(custom_list_path, "rb") as f:
+            custom_list = orjson.loads(f.read())
             try:
-                validate(custom_list, json.load(open(data_dir / "role_schema.json")))
+                validate(custom_list, "role_schema.json", first_error=True)
             except ValidationError as e:
                 print(f"[red]Error:[/] Could not parse '{custom_list}' as it does not match the schema: {e}")
                 return None
@@ -135,16 +188,15 @@ def prep_wiki(script_filter, custom_list=None):
     return wiki
 
 
-def process_role(role, file, wiki, step_progress, step_task, role_output_path):
+def process_role(role, file, wiki, role_output_path, refresh_icons=False):
     """Process a role, grabbing the relevant data and returning a Role object.
 
     Args:
         role (dict): The role data from the script tool.
         file (Path): The file to write the role data to.
         wiki (WikiSoup): The wiki soup object.
-        step_progress (Progress): The progress bar to update.
-        step_task (int): The task to update.
         role_output_path (Path): The path to write the role file to.
+        refresh_icons (bool): Check the icon for changes, even if it was already downloaded.
     """
     name = role['name']
     found_role = Role(name=name)
@@ -152,54 +204,44 @@ def process_role(role, file, wiki, step_progress, step_task, role_output_path):
     # Check if we have a json file for the role
     if file.exists():
         try:
-            with open(file, "r") as f:
-                j = json.load(f)
+            with open(file, "rb") as f:
+                j = orjson.loads(f.read())
             found_role = Role(**j)
-        except json.decoder.JSONDecodeError:
+        except orjson.JSONDecodeError:
             print(f"[red]Error:[/] Could not read {file}. Skipping.")
             return None
     else:
         # Get info from the wiki
-        step_progress.update(step_task, description=f"Getting ability text for {name}")
         found_role.ability = role.get("ability") if role.get("ability") else get_role_ability(name, wiki)
 
-        step_progress.update(step_task, description=f"Getting reminders for {name}")
         found_role.reminders = role.get("reminders") if role.get("reminders") else get_role_reminders(name, wiki)
 
         # Determine night actions
         if role.get("firstNight"):
             found_role.first_night = True
         else:
-            found_role.first_night = True if role['id'] in wiki.night_data['firstNight'] else False
+            found_role.first_night = role['id'] in wiki.first_night_ids
 
         if role.get("otherNight"):
             found_role.other_nights = True
         else:
-            found_role.other_nights = True if role['id'] in wiki.night_data['otherNight'] else False
+            found_role.other_nights = role['id'] in wiki.other_night_ids
 
         # Check if the role affects setup
         if "[" in found_role.ability:
             found_role.affects_setup = True
 
         # Record home script and type
-        home = role.get("version")
-        home = role.get("edition") if home is None else home
-        home = "Unknown" if home is None else home
-        found_role.home_script = home
-
-        team = role.get("roleType")
-        team = role.get("team") if team is None else team
-        team = "Unknown" if team is None else team
-        found_role.type = team
+        found_role.home_script = _coalesce(role, "version", "edition")
+        found_role.type = _coalesce(role, "roleType", "team")
 
     # Grab the icon, checking first to see if it exists
-    step_progress.update(step_task, description=f"Getting icon for {name}")
-    get_role_icon(found_role, role, role_output_path, wiki)
+    get_role_icon(found_role, role, role_output_path, wiki, refresh_icons)
 
     return found_role
 
 
-def get_role_icon(found_role, role, role_output_path, wiki):
+def get_role_icon(found_role, role, role_output_path, wiki, refresh=False):
     """Get the icon for a role, using the wiki if needed.
 
     Args:
@@ -207,8 +249,9 @@ def get_role_icon(found_role, role, role_output_path, wiki):
         role (dict): The role data from the script tool or custom list.
         role_output_path (Path): The path to write the icon to.
         wiki (WikiSoup): The wiki soup object.
+        refresh (bool): Download the icon again if it has changed since the existing copy was saved.
     """
-    if found_role.icon:
+    if found_role.icon and not refresh:
         icon_path = role_output_path / found_role.icon
         if icon_path.exists():
             return
@@ -229,30 +272,57 @@ def get_role_icon(found_role, role, role_output_path, wiki):
             return
         icon_url = urllib.parse.urljoin("https://wiki.bloodontheclocktower.com", icon_url)
     icon_path = role_output_path / f"{format_filename(found_role.name)}{Path(icon_url).suffix}"
-    icon_path.parent.mkdir(parents=True, exist_ok=True)
-    if not icon_path.exists():
-        # Load the image from the web
+    if refresh or not icon_path.exists():
         try:
-            image_bits = urlopen(icon_url).read()
+            image_bits = _download_icon(icon_url, icon_path)
         except HTTPError as e:
-            # Retry failed requests with a few changes
-            # - a slight delay to appease rate limits
-            # - a different User-Agent
-            sleep(0.5)
-            try:
-                req = Request(icon_url, headers={'User-Agent': 'Mozilla/5.0'})
-                image_bits = urlopen(req).read()
-            except HTTPError:
-                print(f"[red]Error:[/] Unable to download icon for {found_role.name}: {str(e)}")
-                return
-        # Parse the image
-        with Image(blob=image_bits) as img:
-            # Remove the extra space around the icon
-            img.trim(color=Color('rgba(0,0,0,0)'), fuzz=0)
-            img.save(filename=str(icon_path))
+            print(f"[red]Error:[/] Unable to download icon for {found_role.name}: {str(e)}")
+            return
+        # Parse the image, unless the copy we already have is still up-to-date
+        if image_bits is not None:
+            with Image(blob=image_bits) as img:
+                # Remove the extra space around the icon
+                img.trim(color=Color('rgba(0,0,0,0)'), fuzz=0)
+                img.save(filename=str(icon_path))
     found_role.icon = str(icon_path.name)
 
 
+def _download_icon(icon_url, icon_path):
+    """Download an icon from the web, retrying once if it fails.
+
+    If there is already a copy of the icon at icon_path, the server is asked to only send the icon if it has changed
+    since that copy was saved.
+
+    Args:
+        icon_url (str): The url of the icon.
+        icon_path (Path): Where the icon will be saved.
+
+    Returns:
+        bytes|None: The icon, or None if the existing copy is still up-to-date.
+
+    Raises:
+        HTTPError: If the icon could not be downloaded.
+    """
+    # Some hosts turn away urllib's default User-Agent, so always send a browser's.
+    headers = dict(request_headers)
+    if icon_path.exists():
+        headers["If-Modified-Since"] = formatdate(icon_path.stat().st_mtime, usegmt=True)
+    req = Request(icon_url, headers=headers)
+    try:
+        return urlopen(req).read()
+    except HTTPError as e:
+        if e.code == 304:  # Not Modified
+            return None
+        # Retry failed requests once, after a slight delay to appease rate limits
+        sleep(0.5)
+        try:
+            return urlopen(req).read()
+        except HTTPError as retry_error:
+            if retry_error.code == 304:  # Not Modified
+                return None
+            raise e
+
+
 def get_role_ability(name, wiki):
     """Get the ability for a role, using the wiki if needed.
 
@@ -0,0 +1,18 @@
+"""Argument types shared by the command line parsers."""
+# Standard Library
+import argparse
+
+
+def positive_int(value):
+    """Parse a command line value as a whole number greater than zero.
+
+    Args:
+        value (str): The value given on the command line.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is zero or negative.
+    """
+    number = int(value)  # argparse reports a ValueError as an invalid value on its own
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {number}")
+    return number
@@ -0,0 +1,48 @@
+"""Helpers for validating json data against the schemas that ship with the package."""
+# Standard Library
+import functools
+import json
+
+# Third Party
+from jsonschema import validators
+from jsonschema.exceptions import best_match
+
+# Application Specific
+from .. import data_dir
+
+
+@functools.lru_cache(maxsize=None)
+def get_validator(schema_name):
+    """Load a schema from the data directory and build a validator for it.
+
+    Each schema is only read, checked and compiled once, no matter how many times it is used.
+
+    Args:
+        schema_name (str): The filename of the schema within the data directory.
+    """
+    with open(data_dir / schema_name, "r") as f:
+        schema = json.load(f)
+    validator_class = validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
+
+def validate(instance, schema_name, first_error=False):
+    """Validate json data against one of our schemas.
+
+    This behaves like jsonschema.validate, raising the most relevant error if the data does not match, but reuses the
+    cached validator for the schema.
+
+    Args:
+        instance: The json data to validate.
+        schema_name (str): The filename of the schema within the data directory.
+        first_error (bool): Raise the first error found, rather than checking the whole document to find the most
+            relevant one. This is quicker to fail on large documents.
+
+    Raises:
+        jsonschema.ValidationError: If the data does not match the schema.
+    """
+    errors = get_validator(schema_name).iter_errors(instance)
+    error = next(errors, None) if first_error else best_match(errors)
+    if error is not None:
+        raise error
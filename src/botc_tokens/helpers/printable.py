@@ -37,6 +37,11 @@ class Printable:
         self.basename = basename
         self.padding = padding
         self.diameter = diameter
+        self._last_token_file = None
+        self._last_token = None
+        # Row spacing depends only on the diameter, so it is worked out once the diameter is known
+        self._row_height = None
+        self._row_inset = None
 
         self.save_page()  # Initializes the first page
 
@@ -45,6 +50,7 @@ class Printable:
         if not (self.current_x == 0 and self.current_y == 0):
             # Only save if we added content
             self.document.sequence.append(self.page)
+            self.page.close()  # The document keeps its own copy, so don't hold on to this one as well
             self.current_x, self.current_y = 0, 0
             self.page_number += 1
             self.next_row_should_be_inset = False
@@ -62,25 +68,44 @@ class Printable:
         """Close all Wand objects."""
         self.document.close()
         self.page.close()
+        if self._last_token is not None:
+            self._last_token.close()
+
+    def _load_token(self, token_file):
+        """Load a token image, reusing the last one if the same file is being added again.
+
+        Duplicates of a token are always added back to back, so only the most recent token needs to be kept.
+        """
+        if token_file != self._last_token_file:
+            if self._last_token is not None:
+                self._last_token.close()
+            self._last_token = Image(filename=token_file)
+            self._last_token_file = token_file
+        return self._last_token
 
     def add_token(self, token_file):
         """Add a token to the current page."""
-        with Image(filename=token_file) as token:
+        token = self._load_token(token_file)
+        if self._row_height is None:
             # Unless we have a fixed diameter, use the largest dimension of the first token as the diameter
             if self.diameter is None:
                 self.diameter = token.width if token.width > token.height else token.height
-            self.page.composite(token, left=int(self.current_x), top=int(self.current_y))
-            if token.width > self.diameter or token.height > self.diameter:
-                token.resize(width=self.diameter, height=self.diameter)
-            self.current_x += self.diameter + self.padding
-            # Check bounds
-            if self.current_x + self.diameter > self.page.width:
-                # When close packing circles, we alternate each row by half the diameter
-                self.current_x = 0 + (0 if self.next_row_should_be_inset else self.diameter * 0.5 + self.padding)
-                self.next_row_should_be_inset = not self.next_row_should_be_inset  # Toggle the row inset
-                # Because we are using close packing, the centers of each circle make a triangle with a base equal to
-                # the radius of the circle and a hypotenuse equal to the diameter. Solving for height leaves us with
-                # the radius * sqrt(3)
-                self.current_y += ((self.diameter // 2) * math.sqrt(3)) + self.padding
-                if self.current_y + self.diameter > self.page.height:
-                    self.save_page()
+            # Because we are using close packing, the centers of each circle make a triangle with a base equal to
+            # the radius of the circle and a hypotenuse equal to the diameter. Solving for height leaves us with
+            # the radius * sqrt(3)
+            self._row_height = ((self.diameter // 2) * math.sqrt(3)) + self.padding
+            # When close packing circles, we alternate each row by half the diameter
+            self._row_inset = self.diameter * 0.5 + self.padding
+        # Shrink tokens that don't fit a fixed diameter before placing them, so they don't spill into their neighbors.
+        # The loaded token is reused for duplicates, so this only happens once per file.
+        if token.width > self.diameter or token.height > self.diameter:
+            token.transform(resize=f"{self.diameter}x{self.diameter}")
+        self.page.composite(token, left=int(self.current_x), top=int(self.current_y))
+        self.current_x += self.diameter + self.padding
+        # Check bounds
+        if self.current_x + self.diameter > self.page.width:
+            self.current_x = 0 if self.next_row_should_be_inset else self._row_inset
+            self.next_row_should_be_inset = not self.next_row_should_be_inset  # Toggle the row inset
+            self.current_y += self._row_height
+            if self.current_y + self.diameter > self.page.height:
+                self.save_page()
@@ -1,10 +1,18 @@
 """This module contains functions for manipulating text and converting it to images."""
+import functools
+import hashlib
 import math
+import os
+from pathlib import Path
 import string
+import threading
 
 from wand.color import Color
 from wand.drawing import Drawing
 from wand.image import Image
+from wand.version import MAGICK_VERSION
+
+from ..__version__ import version
 
 
 def fit_ability_text(text, font_size, first_line_width, step, components):
@@ -17,14 +25,84 @@ def fit_ability_text(text, font_size, first_line_width, step, components):
         step (int): The amount to increase the line width by each time.
         components (TokenComponents): The component package to load fonts from.
     """
-    img = Image(width=1, height=1, resolution=(600, 600))
     # Make sure we have text to draw. Otherwise, just return an empty image.
     if text == "":
-        return img
+        return Image(width=1, height=1, resolution=(600, 600))
+    blob = _render_ability_text(text, font_size, first_line_width, step, str(components.AbilityTextFont),
+                                str(components.AbilityTextBoldFont))
+    return Image(blob=blob, format="miff")
+
+
+# Directory in which rendered text is kept between runs, if any. See set_disk_cache().
+_disk_cache_dir = None
+
+
+def set_disk_cache(cache_dir):
+    """Keep rendered text in a directory, so that later runs can reuse it instead of rendering it again.
+
+    Args:
+        cache_dir (str|Path|None): The directory to keep the rendered text in, or None to only cache in memory.
+    """
+    global _disk_cache_dir
+    _disk_cache_dir = Path(cache_dir) if cache_dir else None
+    if _disk_cache_dir:
+        _disk_cache_dir.mkdir(parents=True, exist_ok=True)
+
+
+@functools.lru_cache(maxsize=None)
+def _font_digest(font_filepath):
+    """Hash a font file, so cached text is keyed on the font itself rather than wherever it was unpacked to."""
+    with open(font_filepath, "rb") as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+
+def _disk_cached(font_count):
+    """Decorate a text renderer so its blobs are also kept in the disk cache, when one is set.
+
+    Args:
+        font_count (int): How many of the renderer's trailing arguments are font file paths.
+    """
+    def decorator(render):
+        @functools.wraps(render)
+        def wrapper(*args):
+            if _disk_cache_dir is None:
+                return render(*args)
+            fonts = [_font_digest(font) for font in args[-font_count:]]
+            # Renders from another version of this package, or another ImageMagick build, may not look the same
+            key_data = repr((version, MAGICK_VERSION, render.__name__, args[:-font_count], fonts)).encode()
+            cache_file = _disk_cache_dir / f"{hashlib.blake2b(key_data, digest_size=16).hexdigest()}.miff"
+            try:
+                return cache_file.read_bytes()
+            except FileNotFoundError:
+                pass
+            blob = render(*args)
+            # Several processes may share the cache, so write to a private file and then move it into place.
+            temp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            temp_file.write_bytes(blob)
+            os.replace(temp_file, cache_file)
+            return blob
+        return wrapper
+    return decorator
+
 
+# Wand images are mutable, so the rendered text is cached as a blob and a fresh image is built from it on every call.
+@functools.lru_cache(maxsize=1024)
+@_disk_cached(font_count=2)
+def _render_ability_text(text, font_size, first_line_width, step, font, bold_font):
+    """Render an ability text fit to a given width, returning the image as a MIFF blob.
+
+    Args:
+        text (str): The text to be displayed.
+        font_size (int): The size of the font to be used.
+        first_line_width (int): The width of the first line of text.
+        step (int): The amount to increase the line width by each time.
+        font (str): The path to the font to use for regular text.
+        bold_font (str): The path to the font to use for bracketed text.
+    """
+    img = Image(width=1, height=1, resolution=(600, 600))
     with Drawing() as draw:
         # Assign font details
-        draw.font = str(components.AbilityTextFont)
+        draw.font = font
         draw.font_size = font_size / 0.9  # We will manipulate the font size in the loop, so start slightly larger
         draw.fill_color = Color("#000000")
         # Determine how many lines we need and how long each line needs to be.
@@ -43,8 +121,12 @@ def fit_ability_text(text, font_size, first_line_width, step, components):
             draw.font_size = draw.font_size * 0.9
             while len(text) > 0:
                 # Find the longest line that fits within the target width
-                metrics = draw.get_font_metrics(img, line_text)
-                while metrics.text_width > target_width:
+                line_width, line_height = _measure(font, draw.font_size, line_text)
+                if line_width > target_width and not (has_bracket and "[" in line_text):
+                    line_text, line_width, line_height = _longest_fitting_line(font, draw.font_size, line_text,
+                                                                               target_width)
+                # Lines with brackets need special handling, so trim them a word at a time.
+                while line_width > target_width:
                     line_text = " ".join(line_text.split(" ")[:-1])
                     # Check for brackets
                     if has_bracket and "[" in line_text:
@@ -54,10 +136,10 @@ def fit_ability_text(text, font_size, first_line_width, step, components):
                         if line_text == "":
                             line_text = f"[{split_text[1]}"
 
-                    metrics = draw.get_font_metrics(img, line_text)
+                    line_width, line_height = _measure(font, draw.font_size, line_text)
                 # Now that we have a line that fits, update all our tracking variables
-                largest_line_width = max(largest_line_width, metrics.text_width)
-                max_height = max_height + metrics.text_height
+                largest_line_width = max(largest_line_width, line_width)
+                max_height = max_height + line_height
                 target_width = target_width + step
 
                 lines.append(line_text)
@@ -67,11 +149,12 @@ def fit_ability_text(text, font_size, first_line_width, step, components):
 
         # Actually draw the text
         current_y = 0
+        current_font = font
         img.resize(width=int(largest_line_width), height=int(max_height * 1.2))  # Add a little padding
         for line_text in lines:
-            metrics = draw.get_font_metrics(img, line_text)
-            current_x = int(((largest_line_width - metrics.text_width) / 2))
-            current_y = int(current_y + metrics.text_height)
+            line_width, line_height = _measure(current_font, draw.font_size, line_text)
+            current_x = int(((largest_line_width - line_width) / 2))
+            current_y = int(current_y + line_height)
             # Change the font to bold if we have a bracket
             if has_bracket and "[" in line_text:
                 split_text = line_text.split("[")
@@ -79,14 +162,105 @@ def fit_ability_text(text, font_size, first_line_width, step, components):
                 if split_text[0]:
                     draw.text(current_x, current_y, split_text[0])
                     # Recalculate our x position and set our font to bold for the rest of the lines
-                    current_x = int(current_x + draw.get_font_metrics(img, split_text[0]).text_width)
-                draw.font = str(components.AbilityTextBoldFont)
+                    current_x = int(current_x + _measure(current_font, draw.font_size, split_text[0])[0])
+                draw.font = current_font = bold_font
                 has_bracket = False  # Skip further bracket checks, since we already set the font to bold
                 line_text = f"[{split_text[1]}"
             draw.text(current_x, current_y, line_text)
         draw(img)
-        img.virtual_pixel = 'transparent'
-    return img
+    with img:
+        # The token art is 8 bits per channel, so there is no need to keep (and cache) more than that.
+        img.depth = 8
+        return img.make_blob("miff")
+
+
+def _longest_fitting_line(font, font_size, line_text, max_width):
+    """Find the most words from the start of a line that fit within a given width.
+
+    This gives the same result as dropping words off the end of the line one at a time until it fits, but needs only a
+    logarithmic number of font metric lookups to get there.
+
+    Args:
+        font (str): The path to the font the line is drawn with.
+        font_size (float): The size of the font.
+        line_text (str): The line to trim. It must already be known not to fit.
+        max_width (int): The widest the line can be.
+
+    Returns:
+        tuple: The trimmed line, followed by its width and height.
+    """
+    words = line_text.split(" ")
+    fits, too_long = 0, len(words)
+    while too_long - fits > 1:
+        middle = (fits + too_long) // 2
+        if _measure(font, font_size, " ".join(words[:middle]))[0] > max_width:
+            too_long = middle
+        else:
+            fits = middle
+    line_text = " ".join(words[:fits])
+    return (line_text, *_measure(font, font_size, line_text))
+
+
+def _fit_font_size(font, font_size, text, max_width):
+    """Shrink a font by 10% at a time until a line of text fits within a width, returning the size that fits.
+
+    Text width scales almost linearly with the font size, so the first measurement tells us roughly how many steps are
+    needed. Hinting and kerning keep that from being exact, so the sizes next to the estimate are checked as well, to
+    land on the same size that shrinking one step at a time would.
+
+    Args:
+        font (str): The path to the font the text is drawn with.
+        font_size (float): The size to start shrinking from.
+        text (str): The text to fit.
+        max_width (float): The widest the text can be.
+    """
+    # Each size is made from the one before it, exactly as shrinking a step at a time would, so the results match
+    font_sizes = [font_size]
+
+    def fits(step):
+        while len(font_sizes) <= step:
+            font_sizes.append(font_sizes[-1] * 0.9)
+        return int(_measure(font, font_sizes[step], text)[0]) <= max_width
+
+    step = 0
+    if not fits(0):
+        text_width = _measure(font, font_size, text)[0]
+        step = max(math.ceil(math.log(max_width / text_width, 0.9)) - 1, 1)
+        if fits(step):
+            # The estimate may have gone too far, so back up as long as a larger size also fits
+            while step > 1 and fits(step - 1):
+                step -= 1
+        else:
+            step += 1
+            while not fits(step):
+                step += 1
+    return font_sizes[step]
+
+
+# Each thread gets its own image and drawing to measure text with, since Wand objects are not safe to share.
+_measuring = threading.local()
+
+
+@functools.lru_cache(maxsize=4096)
+def _measure(font, font_size, text):
+    """Measure a line of text, returning its width and height.
+
+    Fitting text measures the same lines over and over, and every measurement is a round trip to ImageMagick, so the
+    results are cached.
+
+    Args:
+        font (str): The path to the font to measure with.
+        font_size (float): The size of the font.
+        text (str): The text to measure.
+    """
+    if not hasattr(_measuring, "draw"):
+        _measuring.img = Image(width=1, height=1, resolution=(600, 600))
+        _measuring.draw = Drawing()
+    draw = _measuring.draw
+    draw.font = font
+    draw.font_size = font_size
+    metrics = draw.get_font_metrics(_measuring.img, text)
+    return metrics.text_width, metrics.text_height
 
 
 def curved_text_to_image(text, token_type, token_diameter, components):
@@ -99,19 +273,32 @@ def curved_text_to_image(text, token_type, token_diameter, components):
         components (TokenComponents): The component package to load fonts from.
     """
     # Make sure we have text to draw. Otherwise, just return an empty image.
-    img = Image(width=1, height=1, resolution=(600, 600))
     if text == "":
-        return img
+        return Image(width=1, height=1, resolution=(600, 600))
+    font = components.ReminderTextFont if token_type == "reminder" else components.RoleNameFont
+    return Image(blob=_render_curved_text(text, token_type, token_diameter, str(font)), format="miff")
+
+
+@functools.lru_cache(maxsize=1024)
+@_disk_cached(font_count=1)
+def _render_curved_text(text, token_type, token_diameter, font_filepath):
+    """Render a text string as curved text, returning the image as a MIFF blob.
+
+    Args:
+        text (str): The text to be displayed.
+        token_type (str): The type of text to be displayed. Either "reminder" or "role".
+        token_diameter (int): The width of the token. This is used to determine the amount of curvature.
+        font_filepath (str): The path to the font to use.
+    """
+    img = Image(width=1, height=1, resolution=(600, 600))
 
     # Set up the font and color based on the token type
     token_diameter = int(token_diameter - (token_diameter * 0.1))  # Reduce the diameter by 10% to give a little padding
     if token_type == "reminder":
         font_size = token_diameter * 0.15
-        font_filepath = str(components.ReminderTextFont)
         color = "#ECEAED"
     else:
         font_size = token_diameter * 0.1
-        font_filepath = str(components.RoleNameFont)
         color = "#000000"
         text = text.upper()
 
@@ -121,16 +308,10 @@ def curved_text_to_image(text, token_type, token_diameter, components):
         draw.font = font_filepath
         draw.font_size = font_size
         draw.fill_color = Color(color)
-        # Get size of text
-        height, width = 0, math.inf
         # Downsize the text until it fits within the token
-        while True:
-            metrics = draw.get_font_metrics(img, text)
-            height, width = int(metrics.text_height), int(metrics.text_width)
-            if width > 2 * token_diameter * 0.8:
-                draw.font_size = draw.font_size * 0.9
-            else:
-                break
+        draw.font_size = _fit_font_size(font_filepath, font_size, text, 2 * token_diameter * 0.8)
+        text_width, text_height = _measure(font_filepath, draw.font_size, text)
+        height, width = int(text_height), int(text_width)
 
         # Resize the image
         img.resize(width=width, height=int(height * 1.2))
@@ -150,9 +331,29 @@ def curved_text_to_image(text, token_type, token_diameter, components):
         # rotate it 180 degrees since we want it to curve down, then distort and rotate back 180 degrees
         img.rotate(180)
         img.distort('arc', (curve_degree, 180))
-    return img
+    with img:
+        img.depth = 8
+        return img.make_blob("miff")
+
+
+class _FilenameTable(dict):
+    """A str.translate table that drops any character not allowed in a filename.
+
+    Characters are looked up the first time they are seen and remembered after that, so translate can stay in C.
+    """
+
+    valid_chars = frozenset("-_.() %s%s" % (string.ascii_letters, string.digits))
+
+    def __missing__(self, key):
+        value = key if chr(key) in self.valid_chars else None
+        self[key] = value
+        return value
+
+
+_filename_table = _FilenameTable(str.maketrans({' ': '_', '/': '-', '\\': '-', ':': '-', '?': 'Q'}))
 
 
+@functools.lru_cache(maxsize=4096)
 def format_filename(in_string):
     """Take a string and return a valid filename constructed from the string.
 
@@ -164,7 +365,4 @@ def format_filename(in_string):
 
     Note: this method may produce invalid filenames such as ``, `.` or `..`
     """
-    valid_chars = "-_.() %s%s" % (string.ascii_letters, string.digits)
-    in_string = in_string.replace(' ', '_').replace('/', '-').replace('\\', '-').replace(':', '-').replace('?', 'Q')
-    file_name = ''.join(char for char in in_string if char in valid_chars)
-    return file_name
+    return in_string.translate(_filename_table)
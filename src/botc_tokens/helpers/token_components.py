@@ -6,6 +6,7 @@ from tempfile import TemporaryDirectory
 import zipfile
 
 # Third Party
+from wand.color import Color
 from wand.image import Image
 
 # Application Specific
@@ -102,6 +103,8 @@ class TokenComponents:
         self.left_leaf = Image(filename=self.comp_path / "LeafLeft.png")
         self.right_leaf = Image(filename=self.comp_path / "LeafRight.png")
         self.setup_flower = Image(filename=self.comp_path / "SetupFlower.png")
+        self._role_bgs = {}
+        self._role_overlays = {}
 
         self.AbilityTextFont = next(self.comp_path.glob("AbilityText.*"))
         self.AbilityTextBoldFont = next(self.comp_path.glob("AbilityTextBold.*"))
@@ -112,9 +115,66 @@ class TokenComponents:
         """Get the reminder background image."""
         return self.reminder_bg.clone()
 
-    def get_role_bg(self):
-        """Get the role background image."""
-        return self.role_bg.clone()
+    def get_role_bg(self, leaf_count=0):
+        """Get the role background image.
+
+        Args:
+            leaf_count (int): The number of reminder leaves to add to the background. Each count is only composited
+                once, and then cloned for every token that needs it.
+        """
+        leaf_count = min(leaf_count, len(self.leaves))
+        if leaf_count == 0:
+            return self.role_bg.clone()
+        if leaf_count not in self._role_bgs:
+            role_bg = self.role_bg.clone()
+            for leaf in self.leaves[:leaf_count]:
+                role_bg.composite(leaf, left=0, top=0)
+            self._role_bgs[leaf_count] = role_bg
+        return self._role_bgs[leaf_count].clone()
+
+    def get_role_overlay(self, first_night, other_nights, affects_setup):
+        """Get a single image holding all the requested role modifiers (night leaves and setup flower).
+
+        Each combination is only composited once, so a role token needs a single composite for all of its modifiers.
+        The returned image is shared, so it must not be modified or closed by the caller.
+
+        Args:
+            first_night (bool): Include the left leaf, marking a first night action.
+            other_nights (bool): Include the right leaf, marking an action on other nights.
+            affects_setup (bool): Include the setup flower.
+        """
+        key = (bool(first_night), bool(other_nights), bool(affects_setup))
+        if key not in self._role_overlays:
+            overlay = Image(width=self.role_bg.width, height=self.role_bg.height, background=Color("transparent"))
+            for enabled, layer in zip(key, (self.left_leaf, self.right_leaf, self.setup_flower)):
+                if enabled:
+                    overlay.composite(layer, left=0, top=0)
+            self._role_overlays[key] = overlay
+        return self._role_overlays[key]
+
+    def scale(self, role_diameter, reminder_diameter):
+        """Resize the images to the diameters the tokens will be saved at.
+
+        Tokens are composited at the size of their background, so scaling the components down first means every
+        composite works on fewer pixels, and the finished token doesn't need resizing.
+
+        Args:
+            role_diameter (int): The diameter (in pixels) to use for role tokens.
+            reminder_diameter (int): The diameter (in pixels) to use for reminder tokens.
+        """
+        # The layers are drawn over the background at their own size, so shrink them by the same amount as it rather
+        # than to the full token size
+        x_scale = role_diameter / self.role_bg.width
+        y_scale = role_diameter / self.role_bg.height
+        for layer in (*self.leaves, self.left_leaf, self.right_leaf, self.setup_flower):
+            layer.resize(width=max(round(layer.width * x_scale), 1), height=max(round(layer.height * y_scale), 1))
+        self.role_bg.resize(width=role_diameter, height=role_diameter)
+        self.reminder_bg.resize(width=reminder_diameter, height=reminder_diameter)
+        # Any backgrounds or overlays already built are the old size
+        for image in (*self._role_bgs.values(), *self._role_overlays.values()):
+            image.close()
+        self._role_bgs = {}
+        self._role_overlays = {}
 
     def dump(self, target_dir):
         """Dump all component files to a target directory."""
@@ -139,6 +199,8 @@ class TokenComponents:
         self.left_leaf.close()
         self.right_leaf.close()
         self.setup_flower.close()
+        for image in (*self._role_bgs.values(), *self._role_overlays.values()):
+            image.close()
 
         # Clean up the temp directory
         self.temp_dir.cleanup()
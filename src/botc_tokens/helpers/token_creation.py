@@ -11,27 +11,47 @@ from .text_tools import curved_text_to_image, fit_ability_text
 from .token_components import TokenComponents
 
 
-def create_reminder_token(reminder_icon, reminder_text, components, diameter):
-    """Create and save a reminder token.
+def create_reminder_base(reminder_icon, components):
+    """Create a reminder token without its text.
+
+    Every reminder for a role shares the same background and icon, so this can be done once per role and passed to
+    create_reminder_token() for each reminder.
 
     Args:
         reminder_icon (wand.image.Image): The icon to be used for the reminder.
-        reminder_text (str): The text to be displayed on the reminder token.
         components (TokenComponents): The component package to use.
-        diameter (int): The diameter (in pixels) to use for reminder tokens. Components will be resized to fit.
     """
     reminder = components.get_reminder_bg()
     reminder_icon_x = (reminder.width - reminder_icon.width) // 2
     reminder_icon_y = (reminder.height - reminder_icon.height - int(reminder.height * 0.15)) // 2
     reminder.composite(reminder_icon, left=reminder_icon_x, top=reminder_icon_y)
+    return reminder
+
+
+def create_reminder_token(reminder_icon, reminder_text, components, diameter, reminder_base=None):
+    """Create and save a reminder token.
+
+    Args:
+        reminder_icon (wand.image.Image): The icon to be used for the reminder.
+        reminder_text (str): The text to be displayed on the reminder token.
+        components (TokenComponents): The component package to use.
+        diameter (int): The diameter (in pixels) to use for reminder tokens. Components will be resized to fit.
+        reminder_base (wand.image.Image): The result of create_reminder_base() for this icon, if there is one. It is
+            cloned rather than modified.
+    """
+    if reminder_base is None:
+        reminder = create_reminder_base(reminder_icon, components)
+    else:
+        reminder = reminder_base.clone()
     # Add the reminder text
     text_img = curved_text_to_image(string.capwords(reminder_text), "reminder", reminder.width, components)
     text_x = (reminder.width - text_img.width) // 2
     text_y = (reminder.height - text_img.height - int(reminder_icon.height * 0.05))
     reminder.composite(text_img, left=text_x, top=text_y)
     text_img.close()
-    # Resize to requested diameter
-    reminder.resize(width=diameter, height=diameter)
+    # Resize to requested diameter, unless the components were already scaled to it
+    if reminder.size != (diameter, diameter):
+        reminder.resize(width=diameter, height=diameter)
     return reminder
 
 
@@ -45,30 +65,24 @@ def create_role_token(token_icon: Image, role: Role, components: TokenComponents
         diameter (int): The diameter (in pixels) to use for role tokens.
     """
     # Adjust icon size
-    # The "^" modifier means this transform specifies the minimum height and width.
-    # A transform without a modifier specifies the maximum height and width.
+    # A resize without a modifier scales the icon, up or down, to the largest size that fits in the target box while
+    # keeping its aspect ratio.
     target_width = components.role_bg.width * 0.6
     target_height = components.role_bg.height * 0.5
-    token_icon.transform(resize=f"{target_width}x{target_height}^")
     token_icon.transform(resize=f"{target_width}x{target_height}")
 
     # Check if we have reminders. If so, add leaves.
-    token = components.get_role_bg()
-    for leaf in components.leaves[:len(role.reminders)]:
-        token.composite(leaf, left=0, top=0)
+    token = components.get_role_bg(len(role.reminders))
 
     # Determine where to place the icon
     icon_x = (token.width - token_icon.width) // 2
     icon_y = (token.height - token_icon.height + int(token.height * 0.15)) // 2
     token.composite(token_icon, left=icon_x, top=icon_y)
     token_icon.close()
-    # Check for modifiers
-    if role.first_night:
-        token.composite(components.left_leaf, left=0, top=0)
-    if role.other_nights:
-        token.composite(components.right_leaf, left=0, top=0)
-    if role.affects_setup:
-        token.composite(components.setup_flower, left=0, top=0)
+    # Check for modifiers. All of them are applied at once from a pre-composited overlay.
+    if role.first_night or role.other_nights or role.affects_setup:
+        overlay = components.get_role_overlay(role.first_night, role.other_nights, role.affects_setup)
+        token.composite(overlay, left=0, top=0)
     # Add ability text to the token
     ability_text_img = fit_ability_text(
         text=role.ability,
@@ -87,6 +101,7 @@ def create_role_token(token_icon: Image, role: Role, components: TokenComponents
     token.composite(text_img, left=text_x, top=text_y)
     text_img.close()
 
-    # Resize to requested diameter
-    token.resize(width=diameter, height=diameter)
+    # Resize to requested diameter, unless the components were already scaled to it
+    if token.size != (diameter, diameter):
+        token.resize(width=diameter, height=diameter)
     return token
@@ -1,9 +1,13 @@
 """A class to act as a cache for wiki access. That way we don't have to keep hitting the wiki for the same page."""
-import json
+from email.utils import formatdate
+import os
+from pathlib import Path
+import threading
 import urllib.error
-from urllib.request import urlopen
+from urllib.request import Request, urlopen
 
 from bs4 import BeautifulSoup
+import orjson
 
 from .. import data_dir
 
@@ -11,25 +15,47 @@ from .. import data_dir
 class WikiSoup:
     """A class to act as a cache for wiki access."""
 
-    def __init__(self, script_filter: str = "Experimental"):
-        """Prep the reminders and wiki soup."""
+    # Bold, uppercase text on the wiki that is the Storyteller speaking, rather than a reminder token
+    disallowed_reminders = frozenset({
+        "YOU ARE",
+        "THIS PLAYER IS",
+        "THIS CHARACTER SELECTED YOU",
+        "THESE CHARACTERS ARE NOT IN PLAY",
+        "THIS IS THE DEMON",
+        "THESE ARE YOUR MINIONS",
+    })
+
+    def __init__(self, script_filter: str = "Experimental", cache_dir=None):
+        """Prep the reminders and wiki soup.
+
+        Args:
+            script_filter (str): The filter to use when downloading the role data.
+            cache_dir (str): A directory in which to keep wiki pages between runs. Pages found there are only
+                downloaded again if the wiki has changed them since. (Default: None, which keeps them in memory only)
+        """
         self.wiki_soups = {}
         self.reminders = {}
-        with open(data_dir / "known_reminders.json", "r") as f:
-            self.reminders = json.load(f)
+        with open(data_dir / "known_reminders.json", "rb") as f:
+            self.reminders = orjson.loads(f.read())
         self.reminder_overrides = {}
         self.role_data = {}
         self.night_data = {"firstNight": [], "otherNight": []}
+        # The ids from night_data, as sets for quick lookups
+        self.first_night_ids = frozenset()
+        self.other_night_ids = frozenset()
         self._script_filter = script_filter
+        self._cache_dir = Path(cache_dir) if cache_dir else None
 
     def load_from_web(self):
         """Load the role data from the wiki."""
-        roles_from_web = urlopen("https://script.bloodontheclocktower.com/data/roles.json").read().decode('utf-8')
-        self.role_data = json.loads(roles_from_web)
+        roles_from_web = urlopen("https://script.bloodontheclocktower.com/data/roles.json").read()
+        self.role_data = orjson.loads(roles_from_web)
         # Filter the roles
         self.role_data = [role for role in self.role_data if self._script_filter in role['version']]
-        night_from_web = urlopen("https://script.bloodontheclocktower.com/data/nightsheet.json").read().decode('utf-8')
-        self.night_data = json.loads(night_from_web)
+        night_from_web = urlopen("https://script.bloodontheclocktower.com/data/nightsheet.json").read()
+        self.night_data = orjson.loads(night_from_web)
+        self.first_night_ids = frozenset(self.night_data["firstNight"])
+        self.other_night_ids = frozenset(self.night_data["otherNight"])
 
     def _get_wiki_soup(self, role_name):
         """Take a role name and return a BeautifulSoup object for the role's wiki page."""
@@ -39,17 +65,38 @@ class WikiSoup:
             # Make a special check for Spirit of Ivory, since it has a different capitalization scheme.
             if role_name == "Spirit_Of_Ivory":
                 role_name = "Spirit_of_Ivory"
-            url = f"https://wiki.bloodontheclocktower.com/{role_name}"
-            try:
-                html = urlopen(url).read()
-            except urllib.error.HTTPError as e:
-                if e.code == 404:
-                    raise RuntimeError(f"Could not find role {role_name} at {url}")
-                else:
-                    raise
-            self.wiki_soups[role_name] = BeautifulSoup(html, 'html5lib')
+            html = self._get_wiki_page(role_name)
+            self.wiki_soups[role_name] = BeautifulSoup(html, 'html.parser')
         return self.wiki_soups[role_name]
 
+    def _get_wiki_page(self, role_name):
+        """Return the html of a role's wiki page, reusing the copy in the disk cache if it is still up-to-date."""
+        url = f"https://wiki.bloodontheclocktower.com/{role_name}"
+        headers = {}
+        cache_file = None
+        if self._cache_dir:
+            cache_file = self._cache_dir / f"{role_name}.html"
+            if cache_file.exists():
+                # Only have the wiki send the page if it has changed since we saved our copy
+                headers["If-Modified-Since"] = formatdate(cache_file.stat().st_mtime, usegmt=True)
+        try:
+            html = urlopen(Request(url, headers=headers)).read()
+        except urllib.error.HTTPError as e:
+            if e.code == 304:  # Not Modified
+                return cache_file.read_bytes()
+            if e.code == 404:
+                raise RuntimeError(f"Could not find role {role_name} at {url}")
+            else:
+                raise
+        if cache_file:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            # Write to a private file and then move it into place, so an interrupted write can't leave a partial page
+            # behind with a fresh modification time.
+            temp_file = cache_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            temp_file.write_bytes(html)
+            os.replace(temp_file, cache_file)
+        return html
+
     def get_ability_text(self, role_name):
         """Take a role name and grab the ability description."""
         soup = self._get_wiki_soup(role_name)
@@ -86,17 +133,8 @@ class WikiSoup:
             bold_list = paragraph.find_all("b")
             for bold in bold_list:
                 text = bold.get_text()
-                if text.isupper():
-                    disallowed_reminders = [
-                        "YOU ARE",
-                        "THIS PLAYER IS",
-                        "THIS CHARACTER SELECTED YOU",
-                        "THESE CHARACTERS ARE NOT IN PLAY",
-                        "THIS IS THE DEMON",
-                        "THESE ARE YOUR MINIONS",
-                    ]
-                    if text not in disallowed_reminders:
-                        reminders.add(text)
+                if text.isupper() and text not in self.disallowed_reminders:
+                    reminders.add(text)
         return list(reminders)
 
     def get_big_icon_url(self, role_name):
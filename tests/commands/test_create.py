@@ -7,8 +7,9 @@ from unittest.mock import patch
 
 # Third Party
 import pytest
-from testhelpers import check_output_folder
+from testhelpers import check_output_folder, FailingExecutor
 from wand.image import Image
+from wand.resource import limits
 
 # Application Specific
 from botc_tokens.commands import create
@@ -85,6 +86,14 @@ def test_no_input(tmp_path, capsys):
     assert ("No JSON files found in the search directory" in output.out)
 
 
+def test_missing_input(tmp_path, capsys):
+    """Treat a search directory that doesn't exist as having no JSON files."""
+    _run_cmd([str(tmp_path / "not-a-dir")])
+
+    output = capsys.readouterr()
+    assert ("No JSON files found in the search directory" in output.out)
+
+
 def test_standard_run(input_path, default_expected_files):
     """Run normally."""
     output_path = input_path.parent / "output"
@@ -97,6 +106,132 @@ def test_standard_run(input_path, default_expected_files):
     check_output_folder(output_path, expected_files=default_expected_files)
 
 
+def test_serial_run(input_path, default_expected_files):
+    """Create tokens without a worker pool when only one job is requested."""
+    output_path = input_path.parent / "output"
+    _run_cmd([str(input_path), "-o", str(output_path), "--jobs", "1"])
+
+    check_output_folder(output_path, expected_files=default_expected_files)
+
+
+def test_bad_jobs(input_path, capsys):
+    """Reject a job count that can't run anything."""
+    with pytest.raises(SystemExit):
+        _run_cmd([str(input_path), "--jobs", "0"])
+    assert "must be at least 1" in capsys.readouterr().err
+
+
+def test_png_compression(input_path, default_expected_files):
+    """Save tokens at a chosen compression level."""
+    output_path = input_path.parent / "output"
+    _run_cmd([str(input_path), "-o", str(output_path), "--jobs", "1", "--png-compression", "9"])
+
+    check_output_folder(output_path, expected_files=default_expected_files)
+
+
+def test_cache_dir(input_path, default_expected_files):
+    """Keep rendered text in the cache directory, outside the output."""
+    output_path = input_path.parent / "output"
+    cache_path = input_path.parent / "cache"
+    _run_cmd([str(input_path), "-o", str(output_path), "--cache-dir", str(cache_path)])
+
+    check_output_folder(output_path, expected_files=default_expected_files)
+    assert list(cache_path.glob("*.miff"))
+
+
+def test_rebuild_changed(input_path, default_expected_files):
+    """Recreate only the tokens for roles that changed since the last run."""
+    output_path = input_path.parent / "output"
+    args = [str(input_path), "-o", str(output_path), "--jobs", "1", "--rebuild-changed"]
+    _run_cmd(args)
+    check_output_folder(output_path, expected_files=default_expected_files + [create.manifest_name])
+
+    # Change one role, and leave a marker in the unchanged tokens
+    role_json = input_path / "1.json"
+    role_data = json.loads(role_json.read_text())
+    role_data["ability"] = "A different ability"
+    role_json.write_text(json.dumps(role_data))
+    (output_path / "Not-In-Play" / "1.png").write_bytes(b"old")
+    (output_path / "Not-In-Play" / "2.png").write_bytes(b"unchanged")
+    _run_cmd(args)
+
+    # The changed role is recreated without leaving a duplicate reminder behind, the other is left alone.
+    check_output_folder(output_path, expected_files=default_expected_files + [create.manifest_name])
+    assert (output_path / "Not-In-Play" / "1.png").read_bytes() != b"old"
+    assert (output_path / "Not-In-Play" / "2.png").read_bytes() == b"unchanged"
+
+    # A broken manifest means everything is made again
+    (output_path / create.manifest_name).write_text("not json")
+    _run_cmd(args)
+    assert (output_path / "Not-In-Play" / "2.png").read_bytes() != b"unchanged"
+
+
+def test_rebuild_other_spelling(input_path, default_expected_files, monkeypatch):
+    """Don't recreate anything just because the input directory was spelled differently."""
+    output_path = input_path.parent / "output"
+    _run_cmd([str(input_path), "-o", str(output_path), "--jobs", "1", "--rebuild-changed"])
+    (output_path / "Not-In-Play" / "1.png").write_bytes(b"unchanged")
+
+    monkeypatch.chdir(input_path.parent)
+    _run_cmd([f"./{input_path.name}", "-o", str(output_path), "--jobs", "1", "--rebuild-changed"])
+    check_output_folder(output_path, expected_files=default_expected_files + [create.manifest_name])
+    assert (output_path / "Not-In-Play" / "1.png").read_bytes() == b"unchanged"
+
+
+def test_rebuild_missing_icon(tmp_path):
+    """Still hash roles whose icons can't be read."""
+    role = create.Role("Missing", type="Not-In-Play", icon=str(tmp_path / "missing.png"), reminders=[])
+    manifest = create.remove_changed_tokens([role], tmp_path)
+    assert list(manifest) == ["Not-In-Play/Missing.png"]
+
+
+def test_worker(input_path, component_package):
+    """Create tokens the same way a worker process would."""
+    output_path = input_path.parent / "output"
+    role = create.find_roles_from_json([input_path / "1.json"])[0]
+    # Setting up a worker limits ImageMagick to one thread for the whole process, so put it back for the other tests
+    thread_limit = limits["thread"]
+    try:
+        create._init_worker(component_package, 575, 325)
+        create._create_tokens_in_worker(role, output_path, 575, 325)
+    finally:
+        limits["thread"] = thread_limit
+        create._worker_components.close()
+        create._worker_components = None
+
+    expected_files = [
+        str(Path("Not-In-Play") / "1.png"),
+        str(Path("Not-In-Play") / "1-Reminder-Reminder_1.png"),
+    ]
+    check_output_folder(output_path, expected_files=expected_files)
+
+
+def test_worker_error(input_path):
+    """Cancel the roles still waiting on a worker when one of them fails."""
+    output_path = input_path.parent / "output"
+    with patch("botc_tokens.commands.create.ProcessPoolExecutor", FailingExecutor):
+        with pytest.raises(RuntimeError):
+            _run_cmd([str(input_path), "-o", str(output_path), "--jobs", "2"])
+    futures = FailingExecutor.instances[-1].futures
+    assert len(futures) == 9
+    assert all(future.cancelled() for future in futures[1:])
+
+
+def test_duplicate_roles(input_path, default_expected_files):
+    """Only make tokens for the first of several roles with the same name and type."""
+    # A second copy of a role, as if from another script version. Subdirectories are searched after their parent.
+    copy_dir = input_path / "copies"
+    copy_dir.mkdir()
+    duplicate = json.loads((input_path / "1.json").read_text())
+    duplicate["icon"] = "../1.png"
+    duplicate["reminders"] = ["Other reminder"]
+    (copy_dir / "1.json").write_text(json.dumps(duplicate))
+
+    output_path = input_path.parent / "output"
+    _run_cmd([str(input_path), "-o", str(output_path)])
+    check_output_folder(output_path, expected_files=default_expected_files)
+
+
 def test_existing_token(input_path, default_expected_files):
     """Don't overwrite an existing token."""
     output_path = input_path.parent / "output"
@@ -191,15 +326,16 @@ def test_decoding_errors(input_path, capsys):
     output = capsys.readouterr()
     assert "Could not decode JSON file" in output.out
 
-    # Simulate a unicode failure
-    with patch("botc_tokens.commands.create.json.load") as mock:
-        mock.side_effect = UnicodeDecodeError("utf-8", b"", 0, 1, "Bad file")
-        _run_cmd([str(input_path), "-o", str(output_path)])
+    # Files that aren't UTF-8 are reported the same way
+    bad_json.unlink()
+    (input_path / "latin-1.json").write_bytes('{"name": "Café"}'.encode("latin-1"))
+    _run_cmd([str(input_path), "-o", str(output_path)])
     output = capsys.readouterr()
-    assert "Could not decode JSON file:" in output.out
+    assert "Could not decode JSON file" in output.out
+    assert "not valid UTF-8" in output.out
 
     # Simulate a generic failure
-    with patch("botc_tokens.commands.create.json.load") as mock:
+    with patch("botc_tokens.commands.create.orjson.loads") as mock:
         mock.side_effect = Exception("Bad file")
         _run_cmd([str(input_path), "-o", str(output_path)])
     output = capsys.readouterr()
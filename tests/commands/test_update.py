@@ -8,32 +8,48 @@ from unittest import mock
 from urllib.error import HTTPError
 
 # Third Party
-from testhelpers import check_output_folder, expected_role_json, webmock_list
+import pytest
+from testhelpers import check_output_folder, expected_role_json, FailingExecutor, webmock_list
 
 # Application Specific
 from botc_tokens.commands import update
 from botc_tokens.helpers.role import Role
 
 
+# Roles are downloaded in parallel, so the wiki responses are matched by url rather than by the order they are asked
+# for in.
+webmock_urls = {
+    "https://script.bloodontheclocktower.com/data/roles.json": webmock_list[0],
+    "https://script.bloodontheclocktower.com/data/nightsheet.json": webmock_list[1],
+    "https://wiki.bloodontheclocktower.com/First": webmock_list[2],
+    "https://wiki.bloodontheclocktower.com/Second": webmock_list[3],
+    "https://wiki.bloodontheclocktower.com/Third": webmock_list[4],
+}
+
+
 @contextmanager
-def web_mock():
-    """Mock out actual web access."""
-    # First create the return data we would expect from the web, in the order we expect it.
-    wiki_read_mock = mock.MagicMock()
-    wiki_read_mock.read.side_effect = webmock_list
+def web_mock(url_overrides=None):
+    """Mock out actual web access.
+
+    Args:
+        url_overrides (dict): Responses to use for specific urls, instead of the ones in webmock_urls.
+    """
+    responses = {**webmock_urls, **(url_overrides or {})}
+
+    def wiki_response(url):
+        url = getattr(url, "full_url", url)  # Unwrap Request objects
+        response = mock.MagicMock()
+        response.read.return_value = responses[url]
+        return response
+
     image_read_mock = mock.MagicMock()
     image_read_mock.read.return_value = (Path(__file__).parent.parent / "data" / "icons" / "1.png").read_bytes()
 
     # Now mock out all the web calls to instead return the data we created
-    with mock.patch("botc_tokens.helpers.wiki_soup.urlopen") as wiki_soup_urlopen_mock:
-        wiki_soup_urlopen_mock.return_value.__enter__.return_value.read = wiki_read_mock
-        wiki_soup_urlopen_mock.return_value = wiki_read_mock
+    with mock.patch("botc_tokens.helpers.wiki_soup.urlopen", side_effect=wiki_response):
         # Make sure to patch it in the update command as well, since we don't want to actually download the images
         with mock.patch("botc_tokens.commands.update.urlopen") as update_urlopen_mock:
-            update_urlopen_mock.return_value.__enter__.return_value.read = image_read_mock
             update_urlopen_mock.return_value = image_read_mock
-            fake_image = Path(__file__).parent.parent / "data" / "icons" / "1.png"
-            update_urlopen_mock.read.return_value = fake_image.read_bytes()
             yield
 
 
@@ -64,6 +80,29 @@ def test_update_command(tmp_path):
     check_output_folder(output_path, expected_files=expected_files, check_func=check_expected_json)
 
 
+def test_update_worker_error(tmp_path):
+    """Cancel the roles still waiting on a thread when one of them fails."""
+    output_path = tmp_path / "roles"
+    with mock.patch("sys.argv", ["botc_tokens", "update", "--output", str(output_path)]):
+        with web_mock(), mock.patch("botc_tokens.commands.update.ThreadPoolExecutor", FailingExecutor):
+            with pytest.raises(RuntimeError):
+                update.run()
+    futures = FailingExecutor.instances[-1].futures
+    assert len(futures) == 2
+    assert all(future.cancelled() for future in futures[1:])
+
+
+def test_update_bad_jobs(tmp_path, capsys):
+    """Reject a job count that can't run anything."""
+    output_path = tmp_path / "roles"
+    for jobs in ["0", "-1"]:
+        with mock.patch("sys.argv", ["botc_tokens", "update", "--output", str(output_path), "--jobs", jobs]):
+            with pytest.raises(SystemExit):
+                update.run()
+        assert "must be at least 1" in capsys.readouterr().err
+    assert not output_path.exists()
+
+
 def test_update_existing_folder(tmp_path):
     """Test when a file in the output folder already exists."""
     output_path = tmp_path / "roles"
@@ -121,7 +160,8 @@ def test_update_script_filter(tmp_path):
     with mock.patch("sys.argv",
                     ["botc_tokens", "update", "--output", str(output_path), "--script-filter", "99 - Ignored"]
                     ):
-        with web_mock():
+        # Give the third role a wiki page with an icon on it
+        with web_mock({"https://wiki.bloodontheclocktower.com/Third": webmock_list[2]}):
             update.run()
 
     # Verify that it worked
@@ -261,7 +301,7 @@ def test_custom_list(tmp_path):
             {
                 "id": "First",
                 "name": "First",
-                "image": "First.png",
+                "image": "https://example.com/First.png",
                 "team": "townsfolk",
                 "ability": "First Ability",
                 "edition": "99 - Testing",
@@ -271,7 +311,7 @@ def test_custom_list(tmp_path):
             {
                 "id": "Second",
                 "name": "Second",
-                "image": ["Second.png", "Second_evil.png"],
+                "image": ["https://example.com/Second.png", "https://example.com/Second_evil.png"],
                 "team": "townsfolk",
                 "ability": "Second Ability",
                 "edition": "99 - Testing",
@@ -337,3 +377,38 @@ def test_forced_setup(tmp_path, capsys):
     with open(output_path / "99 - Ignored" / "outsider" / "Third.json", "r") as f:
         j = json.load(f)
     assert j["affects_setup"] is True
+
+
+def test_refresh_icon(tmp_path):
+    """Only replace an existing icon if the server has a newer one."""
+    icon_path = tmp_path / "First.png"
+    icon_path.write_bytes(b"old icon")
+    role = {"image": "https://example.com/First.png"}
+    fp = StringIO()  # This is necessary to avoid an issue when deconstructing urllib.error.HTTPError
+    with mock.patch("botc_tokens.commands.update.urlopen") as urlopen_mock:
+        urlopen_mock.return_value.read.side_effect = HTTPError("First.png", 304, "Not Modified", "hdrs", fp)
+        found_role = Role(name="First", icon="First.png")
+        update.get_role_icon(found_role, role, tmp_path, None, refresh=True)
+    # We should have asked for the icon only if it changed, and kept our copy when it hadn't
+    request = urlopen_mock.call_args[0][0]
+    assert request.get_header("If-modified-since")
+    assert icon_path.read_bytes() == b"old icon"
+    assert found_role.icon == "First.png"
+
+    # A copy that is only confirmed up-to-date on the retry is kept as well
+    with mock.patch("botc_tokens.commands.update.urlopen") as urlopen_mock:
+        urlopen_mock.return_value.read.side_effect = [
+            HTTPError("First.png", 429, "Too Many Requests", "hdrs", StringIO()),
+            HTTPError("First.png", 304, "Not Modified", "hdrs", StringIO()),
+        ]
+        with mock.patch("botc_tokens.commands.update.sleep"):
+            update.get_role_icon(found_role, role, tmp_path, None, refresh=True)
+    assert urlopen_mock.call_count == 2
+    assert icon_path.read_bytes() == b"old icon"
+
+    # Now pretend the icon changed
+    with mock.patch("botc_tokens.commands.update.urlopen") as urlopen_mock:
+        new_icon = Path(__file__).parent.parent / "data" / "icons" / "1.png"
+        urlopen_mock.return_value.read.return_value = new_icon.read_bytes()
+        update.get_role_icon(found_role, role, tmp_path, None, refresh=True)
+    assert icon_path.read_bytes() != b"old icon"
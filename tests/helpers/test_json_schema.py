@@ -0,0 +1,28 @@
+"""Tests for the json schema helpers."""
+# Standard Library
+
+# Third Party
+from jsonschema import ValidationError
+import pytest
+
+# Application Specific
+from botc_tokens.helpers import json_schema
+
+
+def test_validator_is_cached():
+    """Only build each validator once."""
+    assert json_schema.get_validator("duplicate_schema.json") is json_schema.get_validator("duplicate_schema.json")
+
+
+def test_validate():
+    """Raise on data that doesn't match the schema, and pass data that does."""
+    json_schema.validate({"imp": 2}, "duplicate_schema.json")
+    with pytest.raises(ValidationError):
+        json_schema.validate({"imp": "two"}, "duplicate_schema.json")
+
+
+def test_validate_first_error():
+    """Stop at the first error, if asked to."""
+    with pytest.raises(ValidationError):
+        json_schema.validate({"imp": "two", "spy": "three"}, "duplicate_schema.json", first_error=True)
+    json_schema.validate({"imp": 2}, "duplicate_schema.json", first_error=True)
@@ -0,0 +1,48 @@
+"""Make sure tokens are laid out on printable pages as expected."""
+# Standard Library
+
+# Third Party Libraries
+import pytest
+from wand.color import Color
+from wand.image import Image
+
+# Application Specific
+from botc_tokens.helpers.printable import Printable
+
+
+@pytest.fixture()
+def big_token(tmp_path):
+    """Create a token that is bigger than the diameter used in these tests."""
+    token_file = tmp_path / "big.png"
+    with Image(width=100, height=100, background=Color("red")) as token:
+        token.save(filename=token_file)
+    return token_file
+
+
+def test_oversized_token(tmp_path, big_token):
+    """Shrink tokens that are bigger than the fixed diameter, so they stay in their own spot."""
+    printable = Printable(tmp_path, page_width=200, page_height=200, diameter=50)
+    try:
+        blank = printable.page[75, 75]
+        printable.add_token(big_token)
+        assert printable._last_token.size == (50, 50)
+        # The token fills its own spot, without spilling into the space around it
+        assert printable.page[25, 25] == Color("red")
+        assert printable.page[75, 75] == blank
+    finally:
+        printable.close()
+
+
+def test_tokens_per_page(tmp_path, big_token):
+    """Fill a page with shrunken tokens before starting the next one."""
+    printable = Printable(tmp_path, page_width=200, page_height=200, diameter=50)
+    try:
+        # Close packed rows of 4, 3, 4 and 3 tokens fit on a 200px page
+        for _ in range(13):
+            printable.add_token(big_token)
+        assert printable.page_number == 1
+        printable.add_token(big_token)
+        assert printable.page_number == 2
+        assert len(printable.document.sequence) == 1
+    finally:
+        printable.close()
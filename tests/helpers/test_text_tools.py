@@ -1,7 +1,9 @@
 """Missing tests for the text tools."""
 # Standard Library
+from unittest.mock import patch
 
 # Third Party
+import pytest
 
 # Application Specific
 from botc_tokens.helpers import text_tools
@@ -46,3 +48,91 @@ def test_multiline_brackets(tmp_path):
     text = "A [test of setup effects that most certainly cause wrapping before the bracket ends]"
     img = text_tools.fit_ability_text(text, 12, 100, 10, TokenComponents())
     assert img.height == 48  # Only check height on this one because GHA rounds differently than local.
+
+
+def test_cached_text():
+    """Repeated text is only rendered once, but every caller gets its own image."""
+    components = TokenComponents()
+    text_tools._render_curved_text.cache_clear()
+    first = text_tools.curved_text_to_image("Poisoned", "reminder", 100, components)
+    second = text_tools.curved_text_to_image("Poisoned", "reminder", 100, components)
+    assert first is not second
+    assert first.size == second.size
+    assert text_tools._render_curved_text.cache_info().hits == 1
+
+
+def test_disk_cached_text(tmp_path):
+    """Rendered text is kept on disk, and read back instead of being rendered again."""
+    components = TokenComponents()
+    cache_dir = tmp_path / "cache"
+    text_tools.set_disk_cache(cache_dir)
+    try:
+        text_tools._render_ability_text.cache_clear()
+        first = text_tools.fit_ability_text("Drunk [+1 Outsider]", 12, 100, 10, components)
+        assert len(list(cache_dir.glob("*.miff"))) == 1
+
+        # Clearing the in-memory cache forces the next call to come from the disk
+        text_tools._render_ability_text.cache_clear()
+        second = text_tools.fit_ability_text("Drunk [+1 Outsider]", 12, 100, 10, components)
+        assert second.signature == first.signature
+        assert len(list(cache_dir.glob("*"))) == 1
+
+        # Another version of the package renders the text again, rather than trusting the old render
+        text_tools._render_ability_text.cache_clear()
+        with patch("botc_tokens.helpers.text_tools.version", "another version"):
+            text_tools.fit_ability_text("Drunk [+1 Outsider]", 12, 100, 10, components)
+        assert len(list(cache_dir.glob("*.miff"))) == 2
+    finally:
+        text_tools.set_disk_cache(None)
+
+
+def _shrink_step_by_step(font, font_size, text, max_width):
+    """Fit text the slow way, shrinking the font by 10% until it fits."""
+    while int(text_tools._measure(font, font_size, text)[0]) > max_width:
+        font_size = font_size * 0.9
+    return font_size
+
+
+def test_fit_font_size():
+    """Jumping ahead to the right font size lands on the same size as shrinking a step at a time."""
+    font = str(TokenComponents().RoleNameFont)
+    for text in ["Imp", "Poisoned", "Spirit of Ivory", "THE KNOWN REMINDER THAT NEVER ENDS, IT JUST GOES ON AND ON"]:
+        for max_width in [40, 120, 400]:
+            expected = _shrink_step_by_step(font, 60, text, max_width)
+            assert text_tools._fit_font_size(font, 60, text, max_width) == expected
+
+
+@pytest.mark.parametrize("power", [0.5, 0.8, 1.3, 2])
+def test_fit_font_size_nonlinear(power):
+    """Still land on the right size when text width doesn't scale linearly with the font size."""
+    def measure(font, font_size, text):
+        return len(text) * font_size ** power, font_size
+
+    with patch("botc_tokens.helpers.text_tools._measure", side_effect=measure):
+        for max_width in range(5, 500, 7):
+            expected = _shrink_step_by_step("font", 100, "Some text", max_width)
+            assert text_tools._fit_font_size("font", 100, "Some text", max_width) == expected
+
+
+def test_cached_measurements():
+    """Measuring the same text twice should only ask ImageMagick once."""
+    font = str(TokenComponents().AbilityTextFont)
+    text_tools._measure.cache_clear()
+    first = text_tools._measure(font, 12, "Each night, choose a player")
+    assert first == text_tools._measure(font, 12, "Each night, choose a player")
+    assert text_tools._measure.cache_info().hits == 1
+    assert first[0] > text_tools._measure(font, 12, "Each night")[0]
+
+
+def test_cached_filename():
+    """Formatting the same string twice should come from the cache."""
+    text_tools.format_filename.cache_clear()
+    assert text_tools.format_filename("Test: Role?") == "Test-_RoleQ"
+    assert text_tools.format_filename("Test: Role?") == "Test-_RoleQ"
+    assert text_tools.format_filename.cache_info().hits == 1
+
+
+def test_format_filename():
+    """Drop anything that doesn't belong in a filename."""
+    assert text_tools.format_filename("Devil's Advocate") == "Devils_Advocate"
+    assert text_tools.format_filename("Ünïcödé/Rôle\\1") == "ncd-Rle-1"
@@ -4,6 +4,8 @@ import zipfile
 
 # Third Party Libraries
 import pytest
+from wand.color import Color
+from wand.image import Image
 
 # Application Specific
 from botc_tokens import component_path
@@ -115,3 +117,67 @@ def test_token_compoents_modified_package(tmp_path, component_package):
     with pytest.raises(FileNotFoundError):
         token_components.dump(tmp_path)
         token_components.close()
+
+
+def test_token_components_role_overlay():
+    """Reuse the same overlay for each combination of modifiers."""
+    token_components = TokenComponents()
+
+    overlay = token_components.get_role_overlay(True, False, True)
+    assert overlay.size == token_components.role_bg.size
+    assert token_components.get_role_overlay(1, 0, 1) is overlay
+    assert token_components.get_role_overlay(True, True, True) is not overlay
+
+    # Close the token components
+    token_components.close()
+
+
+def test_token_components_scale():
+    """Resize the components to the token diameters."""
+    token_components = TokenComponents()
+    overlay = token_components.get_role_overlay(True, True, False)
+
+    token_components.scale(575, 325)
+    assert token_components.role_bg.size == (575, 575)
+    assert token_components.reminder_bg.size == (325, 325)
+    assert all(leaf.size == (575, 575) for leaf in token_components.leaves)
+    # Overlays are rebuilt at the new size
+    assert token_components.get_role_overlay(True, True, False) is not overlay
+    assert token_components.get_role_overlay(True, True, False).size == (575, 575)
+
+    # Close the token components
+    token_components.close()
+
+
+def test_token_components_scale_small_layer(component_package):
+    """Shrink layers that don't cover the whole background by the same amount as the background."""
+    # Swap the first leaf for one that only covers part of the 1067px background
+    with Image(width=400, height=200, background=Color("red")) as leaf:
+        leaf.save(filename=component_package / "Leaf1.png")
+
+    token_components = TokenComponents(component_package)
+    token_components.scale(533, 325)  # Very nearly half size
+    assert token_components.role_bg.size == (533, 533)
+    assert token_components.leaves[0].size == (200, 100)
+    assert token_components.leaves[1].size == (533, 533)
+    token_components.close()
+
+
+def test_token_components_role_bg_leaves():
+    """Build each background with leaves once, and hand out clones of it."""
+    token_components = TokenComponents()
+
+    first = token_components.get_role_bg(2)
+    second = token_components.get_role_bg(2)
+    assert first is not second
+    assert first.signature == second.signature
+    assert first.signature != token_components.role_bg.signature
+    # Asking for more leaves than we have just uses them all
+    assert token_components.get_role_bg(100).signature == token_components.get_role_bg(7).signature
+
+    # Scaling rebuilds the backgrounds at the new size
+    token_components.scale(575, 325)
+    assert token_components.get_role_bg(2).size == (575, 575)
+
+    # Close the token components
+    token_components.close()
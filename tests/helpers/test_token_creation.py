@@ -0,0 +1,27 @@
+"""Missing tests for token creation."""
+# Standard Library
+
+# Third Party
+from wand.image import Image
+
+# Application Specific
+from botc_tokens.helpers.role import Role
+from botc_tokens.helpers.token_components import TokenComponents
+from botc_tokens.helpers.token_creation import create_reminder_token, create_role_token
+
+
+def test_unscaled_components(test_data_dir):
+    """Resize the finished tokens if the components were not scaled to the requested diameters."""
+    components = TokenComponents()
+    role = Role("Test", ability="Test ability", type="Townsfolk", reminders=["Test"], first_night=True)
+
+    icon = Image(filename=test_data_dir / "icons" / "1.png")
+    reminder = create_reminder_token(icon, "Test", components, 325)
+    assert reminder.size == (325, 325)
+    reminder.close()
+
+    token = create_role_token(icon, role, components, 575)
+    assert token.size == (575, 575)
+    token.close()
+
+    components.close()
@@ -35,6 +35,8 @@ def test_wiki_soup_creation():
         assert wiki_soup
         assert wiki_soup.role_data[0]["name"] == "First"
         assert wiki_soup.night_data["firstNight"] == ["DUSK", "First"]
+        assert wiki_soup.first_night_ids == {"DUSK", "First"}
+        assert "Second" in wiki_soup.other_night_ids
 
 
 def test_wiki_soup_get_ability_text():
@@ -187,3 +189,28 @@ def test_spirit_of_ivory():
         with pytest.raises(RuntimeError) as e:
             wiki_soup._get_wiki_soup("Spirit Of Ivory")
         assert "Could not find role Spirit_of_Ivory" in str(e.value)
+
+
+def test_wiki_soup_disk_cache(tmp_path):
+    """Reuse wiki pages saved by an earlier run, unless the wiki has changed them since."""
+    cache_dir = tmp_path / "wiki_cache"
+    with web_mock():
+        wiki_soup = WikiSoup(cache_dir=cache_dir)
+        wiki_soup.load_from_web()
+        assert wiki_soup.get_ability_text("First") == "First ability description"
+    assert list(cache_dir.iterdir()) == [cache_dir / "First.html"]  # Nothing left over from writing it
+
+    # A fresh object should ask for the page only if it changed, and use the copy on disk when it hasn't
+    fp = StringIO()  # This is necessary to avoid an issue when deconstructing urllib.error.HTTPError
+    with mock.patch("botc_tokens.helpers.wiki_soup.urlopen") as urlopen_mock:
+        urlopen_mock.return_value.read.side_effect = urllib.error.HTTPError("test_url", 304, "Not Modified", "hdrs", fp)
+        wiki_soup = WikiSoup(cache_dir=cache_dir)
+        assert wiki_soup.get_ability_text("First") == "First ability description"
+    assert urlopen_mock.call_args[0][0].get_header("If-modified-since")
+
+    # Now pretend the page changed on the wiki
+    changed_page = testhelpers.webmock_list[2].replace(b"First ability description", b"New ability description")
+    with web_mock([changed_page]):
+        wiki_soup = WikiSoup(cache_dir=cache_dir)
+        assert wiki_soup.get_ability_text("First") == "New ability description"
+    assert (cache_dir / "First.html").read_bytes() == changed_page
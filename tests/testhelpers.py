@@ -1,4 +1,5 @@
 """Various helper utilities for testing."""
+from concurrent.futures import Future
 from contextlib import contextmanager
 
 import pytest
@@ -33,6 +34,33 @@ def check_output_folder(output_path, expected_files, check_func=None):
         assert (str(file.relative_to(output_path)) in expected_files)
 
 
+class FailingExecutor:
+    """Stand in for a pool executor, failing the first task and leaving the rest waiting to start."""
+
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        """Accept, and ignore, whatever the real executor would be given."""
+        self.futures = []
+        FailingExecutor.instances.append(self)
+
+    def __enter__(self):
+        """Use the executor as its own context."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Return without waiting on anything, since nothing ever runs."""
+        return False
+
+    def submit(self, fn, *args):
+        """Queue a task, failing it if it is the first one."""
+        future = Future()
+        if not self.futures:
+            future.set_exception(RuntimeError("Worker failed"))
+        self.futures.append(future)
+        return future
+
+
 @contextmanager
 def expect_exit(expected_code=1):
     """Ensure a function exits, and writes an expected string to stdout or stderr."""